@@ -1,11 +1,15 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Depends, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from starlette.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import StreamingResponse
 
-import gzip
+import atexit
+import hashlib
 import json
+import os
 import shutil
 import subprocess
 import sqlite3
@@ -14,11 +18,28 @@ import time
 import uuid
 from pathlib import Path
 
+try:
+    # NVML handle kept for the process lifetime so /health reads GPU counters
+    # directly instead of forking nvidia-smi
+    import pynvml
+    pynvml.nvmlInit()
+except Exception:  # not installed, or no NVIDIA driver
+    pynvml = None
+else:
+    atexit.register(pynvml.nvmlShutdown)
+
+# Grow cached CUDA segments instead of fragmenting between 64^3 and 256^3 window
+# models; must be set before torch's allocator starts (the Docker image sets it too)
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+
 from runtime.session import create_session, session_input_native, model_output_path, session_log, roast_output_path, simnibs_output_path, cleanup_old_sessions
 from runtime.scheduler import scheduler
 from runtime.roast_scheduler import roast_scheduler
 from runtime.simnibs_scheduler import simnibs_scheduler
 from runtime.inference import InferenceOrchestrator
+from runtime.result_cache import prune_cache, release_session as release_cached_results
+from runtime.preprocess import open_gzip_writer, release_volumes
+from runtime.model_cache import preload as preload_models
 from runtime.sse import sse_stream
 from runtime.roast_config import build_roast_config, validate_recipe
 from services.redis_client import (
@@ -29,6 +50,7 @@ from services.redis_client import (
 from config import (
     GPU_COUNT, SESSION_DIR, DB_PATH, NOTIFY_TOKEN_TTL, FRONTEND_URL, ALLOWED_ORIGINS,
     ADMIN_PASSWORD, MAGIC_TOKEN_TTL_MINUTES, MAGIC_LINK_RATE_LIMIT_MAX, MAGIC_LINK_RATE_LIMIT_WINDOW,
+    RESULT_CACHE_TTL_HOURS, MAX_UPLOAD_MB, parse_overlap,
 )
 from services.auth import require_jwt, require_admin_jwt, optional_user_jwt, create_jwt
 from services.workspace_db import (
@@ -69,6 +91,49 @@ def _validate_model_name(model_name: str) -> str:
     return model_name
 
 
+def _copy_and_hash(src, dst, chunk_size: int = 1 << 20) -> str:
+    """Copy a file object to dst and return the SHA-256 hex digest of the bytes copied."""
+    digest = hashlib.sha256()
+    while chunk := src.read(chunk_size):
+        digest.update(chunk)
+        dst.write(chunk)
+    return digest.hexdigest()
+
+
+def _save_upload(src, native_path: Path, gzipped: bool) -> str:
+    """Save an upload as .nii.gz at native_path and return the SHA-256 of the uploaded bytes."""
+    if gzipped:
+        # Already gzipped → just save it
+        with open(native_path, "wb") as f:
+            return _copy_and_hash(src, f)
+    # Uploaded .nii → gzip it while saving so native_path is truly gzipped.
+    # Level 1: this copy is read back once by the models, not archived, and
+    # zlib's default level 9 costs several seconds on a raw 256^3 float volume
+    with open_gzip_writer(native_path) as gz:
+        return _copy_and_hash(src, gz)
+
+
+def _file_response(request: Request, path: Path, filename: str, media_type: str):
+    """
+    FileResponse with conditional GET: outputs are written once per run, so an
+    ETag from (mtime, size) identifies the bytes without hashing the file, and
+    a matching If-None-Match gets a 304 instead of the full volume. Range
+    requests are handled by FileResponse itself.
+    """
+    st = path.stat()
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    response = FileResponse(path=str(path), filename=filename, media_type=media_type, headers=headers)
+    # Volumes are tens to hundreds of MB: 1 MiB reads cut the per-chunk threadpool
+    # hop and ASGI send 16x vs Starlette's 64 KiB default
+    response.chunk_size = 1 << 20
+    return response
+
 
 def _cleanup_stale_jobs():
     """On startup, wipe the active_jobs registry.
@@ -91,7 +156,12 @@ async def lifespan(app: FastAPI):
     init_workspace_db()
     _cleanup_stale_jobs()
     import threading
-    t = threading.Thread(target=scheduler.scheduler_loop, daemon=True)
+    def gpu_scheduler_main():
+        # Jobs queue in Redis while MODEL_PRELOAD loads; GPUs are leased only after
+        preload_models()
+        scheduler.scheduler_loop()
+
+    t = threading.Thread(target=gpu_scheduler_main, daemon=True)
     t.start()
     print("GPU Scheduler started under lifespan()")
 
@@ -112,6 +182,7 @@ async def lifespan(app: FastAPI):
             # Prune workspace DB stale rows
             prune_old_requests()
             prune_expired_tokens()
+            prune_cache(RESULT_CACHE_TTL_HOURS)
             time.sleep(3600)
 
     t3 = threading.Thread(target=cleanup_loop, daemon=True)
@@ -178,6 +249,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON/log responses for clients that accept it. Volumes are already
+# gzipped (or raw ROAST .nii served with Range support) and SSE must not be
+# buffered, so those content types pass through untouched.
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=1024,
+    compresslevel=1,
+    exclude_content_types=("application/gzip", "application/octet-stream", "text/event-stream"),
+)
+
 
 # ============================================================
 # POST /predict
@@ -189,12 +270,27 @@ async def predict(
     space: str = Body(...),
     convert_to_fs: str = Body("false"),
     notify_email: str = Body(""),
+    overlap: str = Body(""),
     workspace_payload: dict | None = Depends(optional_user_jwt),
 ):
     # Validate input
     if not (file.filename.endswith(".nii") or file.filename.endswith(".nii.gz")):
         raise HTTPException(status_code=400, detail="File must be NIfTI")
 
+    # Starlette has already spooled the body to a temp file; refuse oversized
+    # uploads before copying/gzipping them into the session directory
+    if file.size is not None and file.size > MAX_UPLOAD_MB * 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_MB} MB upload limit")
+
+    # Optional sliding-window overlap override (defaults to SW_OVERLAP in config);
+    # one value for all axes or three comma-separated per-axis values
+    sw_overlap = None
+    if overlap.strip():
+        try:
+            sw_overlap = parse_overlap(overlap)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     # Validate file content via magic bytes (gzip: 0x1f 0x8b, or raw NIfTI starts with valid header)
     header_bytes = await file.read(2)
     if file.filename.endswith(".nii.gz") and header_bytes[:2] != b"\x1f\x8b":
@@ -211,14 +307,13 @@ async def predict(
     # Save uploaded file → input native (always store as real .nii.gz)
     native_path = session_input_native(session_id)
     
-    if file.filename.endswith(".nii.gz"):
-        # Already gzipped → just save it
-        with open(native_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-    else:
-        # Uploaded .nii → gzip it while saving so native_path is truly gzipped
-        with gzip.open(native_path, "wb") as gz:
-            shutil.copyfileobj(file.file, gz)
+    # Hash the uploaded bytes while saving so resubmissions can hit the result cache.
+    # Disk writes, gzip and the FreeSurfer conversion below are blocking: run them
+    # in the threadpool so this async handler never stalls the event loop (SSE streams,
+    # other uploads) for their duration.
+    input_sha256 = await run_in_threadpool(
+        _save_upload, file.file, native_path, file.filename.endswith(".nii.gz")
+    )
 
     # Model list
     if models == "all":
@@ -237,7 +332,7 @@ async def predict(
         space=space,
         convert_to_fs=should_convert_to_fs,
     )
-    plan = orchestrator.start_job()
+    plan = await run_in_threadpool(orchestrator.start_job)
 
     # Enqueue job
     scheduler.enqueue(
@@ -247,6 +342,8 @@ async def predict(
             "models": model_list,
             "space": space,
             "plan": plan,
+            "overlap": sw_overlap,
+            "input_sha256": input_sha256,
         }
     )
 
@@ -290,7 +387,7 @@ async def stream(session_id: str):
 # GET /results/{session_id}/{model}
 # ============================================================
 @app.get("/results/{session_id}/{model_name}")
-async def get_result(session_id: str, model_name: str):
+def get_result(request: Request, session_id: str, model_name: str):
     _validate_session_id(session_id)
     _validate_model_name(model_name)
     out_path = model_output_path(session_id, model_name)
@@ -298,36 +395,28 @@ async def get_result(session_id: str, model_name: str):
     if not out_path.exists():
         raise HTTPException(status_code=404, detail="Model output not found")
 
-    return FileResponse(
-        path=str(out_path),
-        filename=f"{model_name}.nii.gz",
-        media_type="application/gzip",
-    )
+    return _file_response(request, out_path, f"{model_name}.nii.gz", "application/gzip")
 
 
 # ============================================================
 # GET /results/{session_id}/input
 # ============================================================
 @app.get("/results/{session_id}/input")
-async def get_input(session_id: str):
+def get_input(request: Request, session_id: str):
     _validate_session_id(session_id)
     input_path = session_input_native(session_id)
 
     if not input_path.exists():
         raise HTTPException(status_code=404, detail="Input file not found")
 
-    return FileResponse(
-        path=str(input_path),
-        filename="input.nii.gz",
-        media_type="application/gzip",
-    )
+    return _file_response(request, input_path, "input.nii.gz", "application/gzip")
 
 
 # ============================================================
 # POST /simulate  — Enqueue a ROAST TES simulation
 # ============================================================
 @app.post("/simulate")
-async def simulate(body: dict = Body(...)):
+def simulate(body: dict = Body(...)):
     session_id = body.get("session_id")
     model_name = body.get("model_name")
 
@@ -390,7 +479,7 @@ async def simulate(body: dict = Body(...)):
 # (legacy — no run_id; kept for backward compatibility)
 # ============================================================
 @app.get("/simulate/results/{session_id}/{model_name}/{output_type}")
-async def get_simulate_result(session_id: str, model_name: str, output_type: str):
+def get_simulate_result(request: Request, session_id: str, model_name: str, output_type: str):
     if output_type not in ("voltage", "efield", "emag", "mask_elec", "mask_gel", "jbrain"):
         raise HTTPException(status_code=400, detail="output_type must be one of: voltage, efield, emag, mask_elec, mask_gel, jbrain")
 
@@ -402,11 +491,7 @@ async def get_simulate_result(session_id: str, model_name: str, output_type: str
     if not out_path.exists():
         raise HTTPException(status_code=404, detail=f"ROAST output '{output_type}' not found for model '{model_name}'. Run simulation first.")
 
-    return FileResponse(
-        path=str(out_path),
-        filename=f"{output_type}.nii",
-        media_type="application/octet-stream",
-    )
+    return _file_response(request, out_path, f"{output_type}.nii", "application/octet-stream")
 
 
 # ============================================================
@@ -414,7 +499,7 @@ async def get_simulate_result(session_id: str, model_name: str, output_type: str
 # (new — includes run_id so each electrode configuration is isolated)
 # ============================================================
 @app.get("/simulate/results/{session_id}/{model_name}/{run_id}/{output_type}")
-async def get_simulate_result_by_run(session_id: str, model_name: str, run_id: str, output_type: str):
+def get_simulate_result_by_run(request: Request, session_id: str, model_name: str, run_id: str, output_type: str):
     if output_type not in ("voltage", "efield", "emag", "mask_elec", "mask_gel", "jbrain"):
         raise HTTPException(status_code=400, detail="output_type must be one of: voltage, efield, emag, mask_elec, mask_gel, jbrain")
 
@@ -426,18 +511,14 @@ async def get_simulate_result_by_run(session_id: str, model_name: str, run_id: s
     if not out_path.exists():
         raise HTTPException(status_code=404, detail=f"ROAST output '{output_type}' not found for model '{model_name}' run '{run_id}'. Run simulation first.")
 
-    return FileResponse(
-        path=str(out_path),
-        filename=f"{output_type}.nii",
-        media_type="application/octet-stream",
-    )
+    return _file_response(request, out_path, f"{output_type}.nii", "application/octet-stream")
 
 
 # ============================================================
 # GET /simulate/status/{session_id}/{model_name}
 # ============================================================
 @app.get("/simulate/status/{session_id}/{model_name}")
-async def get_simulate_status(session_id: str, model_name: str):
+def get_simulate_status(session_id: str, model_name: str):
     status = get_roast_status(session_id, model_name) or "not_started"
     progress = get_roast_progress(session_id, model_name)
     return {"status": status, "progress": progress}
@@ -458,7 +539,7 @@ async def stream_roast(session_id: str):
 # POST /simulate/simnibs  — Enqueue a SimNIBS TES simulation
 # ============================================================
 @app.post("/simulate/simnibs")
-async def simulate_simnibs(body: dict = Body(...)):
+def simulate_simnibs(body: dict = Body(...)):
     session_id = body.get("session_id")
     model_name = body.get("model_name")
 
@@ -497,7 +578,7 @@ async def simulate_simnibs(body: dict = Body(...)):
 # (legacy — no run_id; kept for backward compatibility)
 # ============================================================
 @app.get("/simulate/simnibs/results/{session_id}/{model_name}/{output_type}")
-async def get_simnibs_result(session_id: str, model_name: str, output_type: str):
+def get_simnibs_result(request: Request, session_id: str, model_name: str, output_type: str):
     if output_type not in ("magnJ", "wm_magnJ", "gm_magnJ", "wm_gm_magnJ"):
         raise HTTPException(status_code=400, detail="output_type must be: magnJ, wm_magnJ, gm_magnJ, or wm_gm_magnJ")
 
@@ -512,11 +593,7 @@ async def get_simnibs_result(session_id: str, model_name: str, output_type: str)
             detail=f"SimNIBS output '{output_type}' not found for model '{model_name}'. Run simulation first."
         )
 
-    return FileResponse(
-        path=str(out_path),
-        filename=f"simnibs_{model_name}_{output_type}.nii.gz",
-        media_type="application/gzip",
-    )
+    return _file_response(request, out_path, f"simnibs_{model_name}_{output_type}.nii.gz", "application/gzip")
 
 
 # ============================================================
@@ -524,7 +601,7 @@ async def get_simnibs_result(session_id: str, model_name: str, output_type: str)
 # (new — includes run_id so each electrode configuration is isolated)
 # ============================================================
 @app.get("/simulate/simnibs/results/{session_id}/{model_name}/{run_id}/{output_type}")
-async def get_simnibs_result_by_run(session_id: str, model_name: str, run_id: str, output_type: str):
+def get_simnibs_result_by_run(request: Request, session_id: str, model_name: str, run_id: str, output_type: str):
     if output_type not in ("magnJ", "wm_magnJ", "gm_magnJ", "wm_gm_magnJ"):
         raise HTTPException(status_code=400, detail="output_type must be: magnJ, wm_magnJ, gm_magnJ, or wm_gm_magnJ")
 
@@ -539,18 +616,14 @@ async def get_simnibs_result_by_run(session_id: str, model_name: str, run_id: st
             detail=f"SimNIBS output '{output_type}' not found for model '{model_name}' run '{run_id}'. Run simulation first."
         )
 
-    return FileResponse(
-        path=str(out_path),
-        filename=f"simnibs_{model_name}_{output_type}.nii.gz",
-        media_type="application/gzip",
-    )
+    return _file_response(request, out_path, f"simnibs_{model_name}_{output_type}.nii.gz", "application/gzip")
 
 
 # ============================================================
 # GET /simulate/simnibs/status/{session_id}/{model_name}
 # ============================================================
 @app.get("/simulate/simnibs/status/{session_id}/{model_name}")
-async def get_simnibs_status_endpoint(session_id: str, model_name: str):
+def get_simnibs_status_endpoint(session_id: str, model_name: str):
     status = get_simnibs_status(session_id, model_name) or "not_started"
     progress = get_simnibs_progress(session_id, model_name)
     return {"status": status, "progress": progress}
@@ -571,7 +644,7 @@ async def stream_simnibs(session_id: str):
 # DELETE /session/{session_id}  — Immediately delete session data
 # ============================================================
 @app.delete("/session/{session_id}")
-async def delete_session(session_id: str, token_payload: dict | None = Depends(optional_user_jwt)):
+def delete_session(session_id: str, token_payload: dict | None = Depends(optional_user_jwt)):
     """
     Delete all data for a session.
     - Anonymous callers (no JWT): allowed if the session directory exists (possession = capability).
@@ -608,6 +681,14 @@ async def delete_session(session_id: str, token_payload: dict | None = Depends(o
     except Exception:
         pass
 
+    # Cached segmentations of this upload go with the last session using them,
+    # and any decoded input still held in memory goes now
+    try:
+        release_cached_results(session_id)
+        release_volumes(session_dir)
+    except Exception:
+        pass
+
     # Best-effort Redis cleanup
     try:
         for key in redis_client.scan_iter(f"*{session_id}*"):
@@ -622,7 +703,7 @@ async def delete_session(session_id: str, token_payload: dict | None = Depends(o
 # POST /session/notify  — Request an email restore link
 # ============================================================
 @app.post("/session/notify")
-async def session_notify(body: dict = Body(...)):
+def session_notify(body: dict = Body(...)):
     """
     Store an email address for a session and send a time-limited restore link.
     The link is valid for NOTIFY_TOKEN_TTL seconds (default 6 h).
@@ -663,7 +744,7 @@ async def session_notify(body: dict = Body(...)):
 # GET /session/restore/{token}  — Resolve a restore token
 # ============================================================
 @app.get("/session/restore/{token}")
-async def session_restore(token: str):
+def session_restore(token: str):
     """Return the session_id for a valid restore token."""
     session_id = redis_client.get(f"notify_token:{token}")
     if not session_id:
@@ -686,20 +767,27 @@ async def session_restore(token: str):
 # GET /logs  — Dev endpoint: list all sessions with logs (requires JWT)
 # ============================================================
 @app.get("/logs")
-def list_sessions(_: dict = Depends(require_admin_jwt)):
+def list_sessions(limit: int | None = Query(None, ge=1), offset: int = Query(0, ge=0),
+                  _: dict = Depends(require_admin_jwt)):
     sessions_path = Path(SESSION_DIR)
     if not sessions_path.exists():
         return {"sessions": []}
 
-    sessions = []
-    for session_dir in sorted(sessions_path.iterdir(), key=lambda p: p.stat().st_mtime, reverse=True):
-        if session_dir.is_dir():
-            log_file = session_dir / "logs.jsonl"
-            sessions.append({
-                "session_id": session_dir.name,
-                "has_logs": log_file.exists(),
-                "created": session_dir.stat().st_mtime,
-            })
+    # scandir gets the dir type from readdir, so each session costs one stat
+    # (for mtime) plus the logs.jsonl probe, and only for the returned page
+    with os.scandir(sessions_path) as it:
+        entries = [(e, e.stat(follow_symlinks=False).st_mtime) for e in it if e.is_dir(follow_symlinks=False)]
+    entries.sort(key=lambda item: item[1], reverse=True)
+    page = entries[offset:] if limit is None else entries[offset:offset + limit]
+
+    sessions = [
+        {
+            "session_id": entry.name,
+            "has_logs": os.path.exists(os.path.join(entry.path, "logs.jsonl")),
+            "created": mtime,
+        }
+        for entry, mtime in page
+    ]
     return {"sessions": sessions}
 
 
@@ -717,35 +805,61 @@ def get_session_logs(session_id: str, _: dict = Depends(require_admin_jwt)):
 # ============================================================
 # GET /health
 # ============================================================
+# Probed at most once per second: load balancers, liveness checks and the
+# dashboard all poll this, and each probe queries every GPU
+_HEALTH_TTL_SECONDS = 1.0
+_health_cache: dict = {"ts": float("-inf"), "value": None}
+_health_lock = threading.Lock()
+
+
 @app.get("/health")
-async def health():
+def health():
+    with _health_lock:
+        if time.monotonic() - _health_cache["ts"] >= _HEALTH_TTL_SECONDS:
+            _health_cache["value"] = _probe_health()
+            _health_cache["ts"] = time.monotonic()
+        return _health_cache["value"]
+
+
+def _probe_health() -> dict:
     import os as _os
 
     gpu_usage = []
     try:
-        cmd = [
-            "nvidia-smi",
-            "--query-gpu=utilization.gpu,memory.used,memory.total",
-            "--format=csv,noheader,nounits"
-        ]
-        result = subprocess.check_output(cmd).decode().strip().split("\n")
-        for idx, row in enumerate(result):
-            util, used, total = row.split(", ")
-            gpu_usage.append({
-                "gpu": idx,
-                "util": int(util),
-                "mem_used": int(used),
-                "mem_total": int(total),
-            })
+        if pynvml is not None:
+            for idx in range(pynvml.nvmlDeviceGetCount()):
+                handle = pynvml.nvmlDeviceGetHandleByIndex(idx)
+                mem = pynvml.nvmlDeviceGetMemoryInfo(handle)
+                gpu_usage.append({
+                    "gpu": idx,
+                    "util": int(pynvml.nvmlDeviceGetUtilizationRates(handle).gpu),
+                    "mem_used": mem.used >> 20,  # MiB, as nvidia-smi reports
+                    "mem_total": mem.total >> 20,
+                })
+        else:
+            cmd = [
+                "nvidia-smi",
+                "--query-gpu=utilization.gpu,memory.used,memory.total",
+                "--format=csv,noheader,nounits"
+            ]
+            result = subprocess.check_output(cmd).decode().strip().split("\n")
+            for idx, row in enumerate(result):
+                util, used, total = row.split(", ")
+                gpu_usage.append({
+                    "gpu": idx,
+                    "util": int(util),
+                    "mem_used": int(used),
+                    "mem_total": int(total),
+                })
     except Exception:
         gpu_usage = "Unavailable"
 
+    # ping + llen in one round-trip
     try:
-        redis_ok = redis_client.ping()
+        with redis_client.pipeline(transaction=False) as pipe:
+            redis_ok, queue_len = pipe.ping().llen("job_queue").execute()
     except Exception:
-        redis_ok = False
-
-    queue_len = redis_client.llen("job_queue")
+        redis_ok, queue_len = False, None
 
     # CPU info (container-visible cores via sched_getaffinity)
     try:
@@ -791,7 +905,7 @@ def get_logs(session_id: str, _: dict = Depends(require_admin_jwt)):
 # POST /admin/login
 # ============================================================
 @app.post("/admin/login")
-async def admin_login(body: dict = Body(...)):
+def admin_login(body: dict = Body(...)):
     password = body.get("password", "")
     if not password or password != ADMIN_PASSWORD:
         raise HTTPException(status_code=401, detail="Invalid password")
@@ -825,22 +939,31 @@ def get_admin_jobs(_: dict = Depends(require_admin_jwt)):
 # ============================================================
 # GET /admin/audit
 # ============================================================
+# One connection reused across polls instead of a connect per request; WAL so
+# these reads don't block (or wait on) audit writes
+_audit_conn: sqlite3.Connection | None = None
+_audit_lock = threading.Lock()
+
+
 @app.get("/admin/audit")
 def get_audit(
     _: dict = Depends(require_admin_jwt),
     offset: int = 0,
     limit: int = 100,
 ):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM audit")
-    total = c.fetchone()[0]
-    c.execute(
-        "SELECT ts, session_id, model, event, detail FROM audit ORDER BY id DESC LIMIT ? OFFSET ?",
-        (limit, offset),
-    )
-    rows = c.fetchall()
-    conn.close()
+    global _audit_conn
+    with _audit_lock:
+        if _audit_conn is None:
+            _audit_conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+            _audit_conn.execute("PRAGMA journal_mode=WAL")
+        c = _audit_conn.cursor()
+        c.execute("SELECT COUNT(*) FROM audit")
+        total = c.fetchone()[0]
+        c.execute(
+            "SELECT ts, session_id, model, event, detail FROM audit ORDER BY id DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        )
+        rows = c.fetchall()
     return {"events": rows, "total": total, "offset": offset, "limit": limit}
 
 
@@ -848,7 +971,7 @@ def get_audit(
 # POST /cancel/{session_id}
 # ============================================================
 @app.post("/cancel/{session_id}")
-async def cancel_job(session_id: str):
+def cancel_job(session_id: str):
     from services.redis_client import cancel_session
     from runtime.sse import push_event
     cancel_session(session_id)
@@ -860,7 +983,7 @@ async def cancel_job(session_id: str):
 # GET /results/{session_id}/{model_name}/stats  — tissue volume stats
 # ============================================================
 @app.get("/results/{session_id}/{model_name}/stats")
-async def get_model_stats(session_id: str, model_name: str):
+def get_model_stats(session_id: str, model_name: str):
     """Return per-label tissue volume statistics (mm³) for a segmentation output."""
     _validate_session_id(session_id)
     _validate_model_name(model_name)
@@ -888,7 +1011,7 @@ def _validate_email(email: str) -> str:
 
 
 @app.post("/workspace/request-magic-link")
-async def workspace_request_magic_link(body: dict = Body(...)):
+def workspace_request_magic_link(body: dict = Body(...)):
     """Send a magic sign-in link. Always returns {"status": "sent"} (no email enumeration)."""
     email = _validate_email(body.get("email", "").strip())
 
@@ -914,7 +1037,7 @@ async def workspace_request_magic_link(body: dict = Body(...)):
 
 
 @app.get("/workspace/verify/{token}")
-async def workspace_verify(token: str):
+def workspace_verify(token: str):
     """Consume a magic token and return a workspace JWT."""
     user_id = consume_magic_token(token)
     if user_id is None:
@@ -940,7 +1063,7 @@ async def workspace_verify(token: str):
 
 
 @app.get("/workspace/me")
-async def workspace_me(payload: dict = Depends(require_jwt)):
+def workspace_me(payload: dict = Depends(require_jwt)):
     if payload.get("role") != "user":
         raise HTTPException(status_code=403, detail="Workspace user account required")
     user = get_user_by_id(payload["user_id"])
@@ -950,7 +1073,7 @@ async def workspace_me(payload: dict = Depends(require_jwt)):
 
 
 @app.get("/workspace/sessions")
-async def workspace_sessions(payload: dict = Depends(require_jwt)):
+def workspace_sessions(payload: dict = Depends(require_jwt)):
     if payload.get("role") != "user":
         raise HTTPException(status_code=403, detail="Workspace user account required")
     user_id = payload["user_id"]
@@ -968,7 +1091,7 @@ async def workspace_sessions(payload: dict = Depends(require_jwt)):
 
 
 @app.delete("/workspace/account")
-async def workspace_delete_account(payload: dict = Depends(require_jwt)):
+def workspace_delete_account(payload: dict = Depends(require_jwt)):
     if payload.get("role") != "user":
         raise HTTPException(status_code=403, detail="Workspace user account required")
     user_id = payload["user_id"]
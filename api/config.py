@@ -14,9 +14,13 @@ BASE_DIR = Path(__file__).parent.resolve()
 
 SESSION_DIR = BASE_DIR / "sessions"
 MODEL_DIR = BASE_DIR / "models"
+RESULT_CACHE_DIR = BASE_DIR / "cache"
+# Serialized TensorRT engines (models/ is mounted read-only)
+ENGINE_DIR = Path(os.getenv("ENGINE_DIR", str(BASE_DIR / "engines")))
 
 SESSION_DIR.mkdir(exist_ok=True)
 MODEL_DIR.mkdir(exist_ok=True)
+RESULT_CACHE_DIR.mkdir(exist_ok=True)
 
 # -------------------------------------------------------
 # REDIS CONFIG
@@ -52,8 +56,11 @@ ALLOWED_ORIGINS: list[str] = [
     if o.strip()
 ]
 
-# SSE heartbeat interval
-SSE_HEARTBEAT_SECONDS = 15
+# Seconds of silence on an SSE stream before a heartbeat is sent
+SSE_HEARTBEAT_SECONDS = 5
+
+# Largest accepted /predict upload (MiB); bigger files are rejected with 413
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "512"))
 
 # -------------------------------------------------------
 # GPU CONFIG
@@ -63,6 +70,48 @@ GPU_COUNT = int(os.getenv("GPU_COUNT", "4"))
 # Timeout for job execution
 JOB_TIMEOUT_SECONDS = int(os.getenv("JOB_TIMEOUT_SECONDS", "3600"))
 
+# Run UNETR forward passes under CUDA autocast (bf16 on Ampere+, fp16 otherwise)
+INFERENCE_AMP = os.getenv("INFERENCE_AMP", "true").lower() == "true"
+
+# Compile cached UNETRs with torch.compile (CUDA graphs); first load pays the compile
+TORCH_COMPILE = os.getenv("TORCH_COMPILE", "false").lower() == "true"
+
+# UNETR backend on CUDA: "torch" (eager / torch.compile) or "tensorrt" (torch_tensorrt,
+# fp16 engine built per model and GPU on first load; falls back to torch if unavailable)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+
+# Sliding-window defaults: fraction of each ROI shared with its neighbours,
+# blended with a Gaussian importance map so window borders carry less weight
+def parse_overlap(value: str):
+    """
+    "0.5" -> 0.5, or "0.5,0.5,0.25" -> (0.5, 0.5, 0.25) per spatial axis.
+    Raises ValueError unless every value is in [0, 1).
+    """
+    parts = [float(p) for p in value.split(",")]
+    if len(parts) not in (1, 3) or not all(0.0 <= p < 1.0 for p in parts):
+        raise ValueError("overlap must be one value or three comma-separated values, each >= 0 and < 1")
+    return parts[0] if len(parts) == 1 else tuple(parts)
+
+
+SW_OVERLAP = parse_overlap(os.getenv("SW_OVERLAP", "0.5"))
+SW_MODE = os.getenv("SW_MODE", "gaussian")
+# Gaussian blend width as a fraction of the ROI (MONAI sigma_scale)
+SW_SIGMA_SCALE = 0.125
+
+# Windows per UNETR forward; halved on CUDA OOM down to 1
+SW_BATCH_SIZE = max(1, int(os.getenv("SW_BATCH_SIZE", "4")))
+
+# Reuse segmentation outputs when the same upload is resubmitted to the same model
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_TTL_HOURS = int(os.getenv("RESULT_CACHE_TTL_HOURS", "24"))
+
+# Loaded UNETRs kept resident per GPU between jobs (LRU beyond this count)
+MODEL_CACHE_PER_GPU = int(os.getenv("MODEL_CACHE_PER_GPU", "3"))
+
+# Models loaded onto every GPU at startup, before the scheduler takes jobs
+# (comma-separated registry names; empty = load lazily on first use)
+MODEL_PRELOAD = [m.strip() for m in os.getenv("MODEL_PRELOAD", "").split(",") if m.strip()]
+
 # -------------------------------------------------------
 # ROAST CONFIG
 # -------------------------------------------------------
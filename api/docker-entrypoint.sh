@@ -25,23 +25,9 @@ until python -c "import redis; r = redis.Redis(host='${REDIS_HOST:-localhost}',
 done
 echo "Redis is ready!"
 
-# Start the GPU scheduler in background
-echo "Starting GPU scheduler daemon..."
-python -c "
-import threading
-from runtime.scheduler import scheduler
-
-def run_scheduler():
-    scheduler.scheduler_loop()
-
-t = threading.Thread(target=run_scheduler, daemon=True)
-t.start()
-print('Scheduler started in background thread')
-" &
-
-# Give scheduler a moment to start
-sleep 2
-
-# Start the FastAPI application
+# Start the FastAPI application. The GPU/ROAST/SimNIBS schedulers run as
+# threads inside this single worker (see lifespan() in app.py) so the
+# process-wide model cache and GPU leases live in one process; more workers
+# would each start their own schedulers. No --reload in production.
 echo "Starting FastAPI application on port 8100..."
 exec uvicorn app:app --host 0.0.0.0 --port 8100 --workers 1
@@ -0,0 +1,287 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Tuple
+
+import torch
+from torch.nn.modules.utils import consume_prefix_in_state_dict_if_present
+from monai.data.utils import compute_importance_map
+from monai.networks.nets import UNETR
+
+from config import MODEL_CACHE_PER_GPU, MODEL_PRELOAD, GPU_COUNT, INFERENCE_AMP, TORCH_COMPILE, INFERENCE_BACKEND, SW_MODE, SW_SIGMA_SCALE, SW_BATCH_SIZE, ENGINE_DIR
+from services.logger import log_info
+
+"""
+PROCESS-WIDE UNETR CACHE
+
+Checkpoints are read from disk once per (checkpoint, device) and the
+eval-mode module is handed to every later ModelRunner on that device.
+The GPU scheduler leases each device to one model run at a time, so a
+cached module is never used by two threads concurrently.
+
+Entries are evicted LRU-first once a device holds more than
+MODEL_CACHE_PER_GPU models, and reloaded if the checkpoint file changes.
+The CPU state dict of a cached checkpoint is shared, so placing the same
+model on another GPU does not read the checkpoint from disk again.
+"""
+
+# (checkpoint, device) -> (checkpoint mtime, model)
+_cache: "OrderedDict[Tuple[str, str], Tuple[float, torch.nn.Module]]" = OrderedDict()
+_lock = threading.Lock()
+
+# Window shapes are fixed per model, so cuDNN's per-shape algorithm search
+# runs once per cached model and every later window reuses the fastest kernel
+torch.backends.cudnn.benchmark = True
+
+# TF32 tensor cores for whatever still runs in fp32 (INFERENCE_AMP=false, or
+# ops autocast keeps in fp32); argmax labels are insensitive to the lost mantissa
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.allow_tf32 = True
+
+# checkpoint -> (mtime, CPU state dict), kept while any device caches that checkpoint
+_states: "dict[str, Tuple[float, dict]]" = {}
+
+# (roi_size, device, dtype) -> (1, 1, *roi_size) sliding-window blend weights
+_weight_maps: "dict[Tuple[tuple, str, torch.dtype], torch.Tensor]" = {}
+
+
+# -------------------------------------------------------
+# PRECISION
+# -------------------------------------------------------
+def autocast(device: str):
+    """
+    Mixed-precision context for UNETR forward passes on a device.
+    bf16 where the GPU supports it (Ampere+), fp16 otherwise; disabled on CPU.
+    """
+    if not INFERENCE_AMP or not device.startswith("cuda"):
+        return torch.autocast(device_type="cpu", enabled=False)
+    major, _ = torch.cuda.get_device_capability(torch.device(device))
+    dtype = torch.bfloat16 if major >= 8 else torch.float16
+    return torch.autocast(device_type="cuda", dtype=dtype)
+
+
+# -------------------------------------------------------
+# BUILD
+# -------------------------------------------------------
+def build_model(checkpoint: Path, spatial_size, num_classes: int, proj_type: str, device: str,
+                warmup_batch: int = SW_BATCH_SIZE) -> torch.nn.Module:
+    model = UNETR(
+        in_channels=1,
+        out_channels=num_classes,
+        img_size=spatial_size,
+        feature_size=16,
+        hidden_size=768,
+        mlp_dim=3072,
+        num_heads=12,
+        proj_type=proj_type,
+        norm_name="instance",
+        res_block=True,
+        dropout_rate=0.0,
+    )
+
+    # strict=False kept for checkpoints carrying extra entries, but a key
+    # mismatch is logged rather than silently leaving layers at random init
+    result = model.load_state_dict(_load_state(checkpoint), strict=False)
+    if result.missing_keys or result.unexpected_keys:
+        log_info("SYSTEM", f"Checkpoint {checkpoint.name}: {len(result.missing_keys)} missing keys "
+                           f"{result.missing_keys[:5]}, {len(result.unexpected_keys)} unexpected keys "
+                           f"{result.unexpected_keys[:5]}")
+
+    model = model.to(device).eval()
+    if device.startswith("cuda"):
+        # NDHWC layout lets cuDNN pick its tensor-core 3D conv kernels
+        model = model.to(memory_format=torch.channels_last_3d)
+
+        if INFERENCE_BACKEND == "tensorrt":
+            engine = _build_tensorrt(model, checkpoint, spatial_size, device, warmup_batch)
+            if engine is not None:
+                return engine
+
+        if TORCH_COMPILE:
+            # Sliding-window inference feeds (sw_batch_size, 1, *spatial_size) plus a
+            # batch-1 tail (and a single batch-1 window for 256^3 FS inputs), so both
+            # static shapes are compiled here instead of on the first job. Only the
+            # Dynamo/Inductor compile carries over: CUDA graph trees are
+            # thread-local and every job runs on fresh scheduler threads, so each
+            # job still records its graphs on its first windows.
+            model = torch.compile(model, mode="reduce-overhead", fullgraph=False, dynamic=False)
+            with torch.inference_mode(), autocast(device):
+                for batch in sorted({warmup_batch, 1}, reverse=True):
+                    model(torch.zeros((batch, 1, *spatial_size), device=device))
+
+    return model
+
+
+def _load_state(checkpoint: Path) -> dict:
+    """
+    Read a checkpoint's weights once; loading the same model onto another GPU
+    reuses the CPU copy instead of unpickling the file again.
+    """
+    key = str(checkpoint)
+    mtime = checkpoint.stat().st_mtime
+    with _lock:
+        entry = _states.get(key)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+
+    try:
+        # mmap: tensors are views of the page-cached file instead of a second
+        # full copy read through Python (zip-format checkpoints only)
+        state = torch.load(checkpoint, map_location="cpu", weights_only=True, mmap=True)
+    except RuntimeError:
+        state = torch.load(checkpoint, map_location="cpu", weights_only=True)
+    # DataParallel-saved checkpoints: strip the leading "module." in place
+    # (a substring replace would also rewrite keys that merely contain it)
+    consume_prefix_in_state_dict_if_present(state, "module.")
+    with _lock:
+        _states[key] = (mtime, state)
+    return state
+
+
+def _tensorrt_path(checkpoint: Path, spatial_size, device: str, max_batch: int) -> Path:
+    """Serialized engine location under ENGINE_DIR, keyed by checkpoint, GPU arch, roi and batch."""
+    major, minor = torch.cuda.get_device_capability(torch.device(device))
+    roi = "x".join(str(s) for s in spatial_size)
+    return ENGINE_DIR / f"{checkpoint.stem}.sm{major}{minor}.{roi}.b{max_batch}.trt.ep"
+
+
+def _build_tensorrt(model: torch.nn.Module, checkpoint: Path, spatial_size, device: str, max_batch: int):
+    """
+    Compile an eval-mode UNETR into an fp16 TensorRT module. Windows arrive as
+    (1..max_batch, 1, *spatial_size): the OOM retry and the last partial batch
+    of sliding_window_inference both drop below sw_batch_size.
+    The engine is saved under ENGINE_DIR and reloaded by later processes while
+    it is newer than the checkpoint, so restarts skip the multi-minute build.
+    Returns None (caller keeps the PyTorch module) if torch_tensorrt is missing
+    or the build fails.
+    """
+    try:
+        import torch_tensorrt
+    except ImportError:
+        log_info("SYSTEM", "INFERENCE_BACKEND=tensorrt but torch_tensorrt is not installed, using PyTorch")
+        return None
+
+    engine_path = _tensorrt_path(checkpoint, spatial_size, device, max_batch)
+    if engine_path.exists() and engine_path.stat().st_mtime >= checkpoint.stat().st_mtime:
+        try:
+            with torch.cuda.device(torch.device(device)):
+                engine = torch_tensorrt.load(str(engine_path)).module()
+            log_info("SYSTEM", f"Loaded TensorRT engine {engine_path.name} on {device}")
+            return engine
+        except Exception as e:
+            # e.g. written by a different TensorRT version; rebuild below
+            log_info("SYSTEM", f"Could not load TensorRT engine {engine_path.name}, rebuilding: {e}")
+
+    try:
+        inputs = [torch_tensorrt.Input(
+            min_shape=(1, 1, *spatial_size),
+            opt_shape=(max_batch, 1, *spatial_size),
+            max_shape=(max_batch, 1, *spatial_size),
+            dtype=torch.float32,
+        )]
+        with torch.cuda.device(torch.device(device)):
+            engine = torch_tensorrt.compile(
+                model,
+                ir="dynamo",
+                inputs=inputs,
+                enabled_precisions={torch.float16},
+            )
+    except Exception as e:
+        log_info("SYSTEM", f"TensorRT build failed on {device}, using PyTorch: {e}")
+        return None
+
+    try:
+        ENGINE_DIR.mkdir(parents=True, exist_ok=True)
+        torch_tensorrt.save(engine, str(engine_path), retrace=False)
+    except Exception as e:
+        log_info("SYSTEM", f"Could not save TensorRT engine {engine_path.name}: {e}")
+    return engine
+
+
+# -------------------------------------------------------
+# LOOKUP
+# -------------------------------------------------------
+def get_model(checkpoint: Path, spatial_size, num_classes: int, proj_type: str, device: str) -> Tuple[torch.nn.Module, bool]:
+    """
+    Return (model, cache_hit) for a checkpoint on a device, loading it on a miss.
+    """
+    key = (str(checkpoint), device)
+    mtime = checkpoint.stat().st_mtime
+
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == mtime:
+            _cache.move_to_end(key)
+            return entry[1], True
+
+    model = build_model(checkpoint, spatial_size, num_classes, proj_type, device)
+
+    with _lock:
+        _cache[key] = (mtime, model)
+        _cache.move_to_end(key)
+        _evict(device)
+
+    return model, False
+
+
+def preload():
+    """
+    Load MODEL_PRELOAD onto every GPU so first jobs skip checkpoint load
+    (and the torch.compile / TensorRT engine build, though not CUDA graph
+    capture, which happens per job thread). Runs before the scheduler starts
+    leasing GPUs.
+    """
+    from runtime.registry import get_model_config
+
+    if not MODEL_PRELOAD or not torch.cuda.is_available():
+        return
+
+    for gpu_id in range(min(GPU_COUNT, torch.cuda.device_count())):
+        for model_name in MODEL_PRELOAD[:MODEL_CACHE_PER_GPU]:
+            try:
+                cfg = get_model_config(model_name)
+                get_model(Path(cfg["checkpoint"]), cfg["spatial_size"], 12, cfg["proj_type"], f"cuda:{gpu_id}")
+                log_info("SYSTEM", f"Preloaded {model_name} on GPU {gpu_id}")
+            except Exception as e:
+                log_info("SYSTEM", f"Preload of {model_name} on GPU {gpu_id} failed: {e}")
+
+
+def _evict(device: str):
+    """Drop least-recently-used models on a device beyond MODEL_CACHE_PER_GPU (caller holds _lock)."""
+    on_device = [k for k in _cache if k[1] == device]
+    for key in on_device[:max(0, len(on_device) - MODEL_CACHE_PER_GPU)]:
+        del _cache[key]
+
+    # Host weights are only worth keeping while some GPU still holds the model
+    held = {k[0] for k in _cache}
+    for checkpoint in [c for c in _states if c not in held]:
+        del _states[checkpoint]
+
+
+# -------------------------------------------------------
+# SLIDING-WINDOW WEIGHTS
+# -------------------------------------------------------
+def roi_weight_map(roi_size, device: str, dtype: torch.dtype = torch.float32,
+                   sigma_scale: float = SW_SIGMA_SCALE) -> torch.Tensor:
+    """
+    Per-window blend weights for sliding_window_inference, built once per
+    (roi_size, device, dtype). MONAI otherwise recomputes the Gaussian map on
+    every call (64 MiB for a 256^3 FreeSurfer window), and casts it to the
+    input dtype.
+    """
+    key = (tuple(roi_size), device, dtype)
+    with _lock:
+        weights = _weight_maps.get(key)
+        if weights is None:
+            weights = compute_importance_map(
+                tuple(roi_size), mode=SW_MODE, sigma_scale=sigma_scale, device=device, dtype=torch.float32
+            )[None, None].to(dtype)
+            _weight_maps[key] = weights
+    return weights
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+        _states.clear()
+        _weight_maps.clear()
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from config import (
+    RESULT_CACHE_DIR, SW_OVERLAP, SW_MODE, INFERENCE_AMP, INFERENCE_BACKEND, TORCH_COMPILE,
+)
+from runtime.registry import get_model_config
+from services.logger import log_info
+
+"""
+CONTENT-ADDRESSED SEGMENTATION CACHE
+
+A resubmitted volume (same uploaded bytes) run through the same model with the
+same inference settings produces the same labels, so the scheduler copies the
+earlier output instead of running the model again.
+
+Layout:
+    cache/<key>/output.nii.gz        (+ output_fs.nii.gz for FreeSurfer models)
+    cache/<key>/refs/<session_id>    one empty file per session using the entry
+
+The key covers the upload digest, model registry entry, checkpoint mtime, model
+input, CACHE_VERSION and every setting that changes the prediction. Outputs are patient-derived, so an
+entry is deleted with the last session referencing it (release_session()), and
+unreferenced or idle entries expire with prune_cache().
+"""
+
+# Bump whenever preprocessing or postprocessing changes what a model outputs,
+# so entries from older code stop matching
+CACHE_VERSION = 1
+
+
+def cache_key(input_sha256: str, model_name: str, input_space: str, input_name: str,
+              overlap: float | None) -> str:
+    """
+    input_name is the model input file (native vs FreeSurfer-converted), which
+    differs for the same upload depending on the convert_to_fs choice.
+    """
+    model_config = get_model_config(model_name)
+    checkpoint = Path(model_config["checkpoint"])
+    parts = {
+        "version": CACHE_VERSION,
+        "input": input_sha256,
+        "model": model_name,
+        "config": model_config,
+        "checkpoint_mtime": checkpoint.stat().st_mtime if checkpoint.exists() else None,
+        "space": input_space,
+        "input_file": input_name,
+        "overlap": SW_OVERLAP if overlap is None else overlap,
+        "mode": SW_MODE,
+        "amp": INFERENCE_AMP,
+        "backend": INFERENCE_BACKEND,
+        "compile": TORCH_COMPILE,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _outputs(entry: Path) -> list[Path]:
+    return sorted(entry.glob("output*.nii.gz")) if entry.is_dir() else []
+
+
+def _add_ref(entry: Path, session_id: str):
+    refs = entry / "refs"
+    refs.mkdir(exist_ok=True)
+    (refs / session_id).touch()
+
+
+def restore(key: str, model_dir: Path, session_id: str) -> bool:
+    """Copy cached outputs into a session model directory. Returns True on a hit."""
+    entry = Path(RESULT_CACHE_DIR) / key
+    try:
+        outputs = _outputs(entry)
+        if not outputs:
+            return False
+
+        model_dir.mkdir(parents=True, exist_ok=True)
+        for src in outputs:
+            shutil.copyfile(src, model_dir / src.name)
+        _add_ref(entry, session_id)
+        entry.touch()
+        return True
+    except OSError as e:
+        # e.g. prune_cache removed the entry mid-copy; the model just runs
+        log_info("SYSTEM", f"Result cache restore failed for {key}: {e}")
+        return False
+
+
+def store(key: str, model_dir: Path, session_id: str):
+    """Save a finished model's outputs under its cache key (best-effort)."""
+    root = Path(RESULT_CACHE_DIR)
+    entry = root / key
+    tmp = None
+    try:
+        # Private staging dir: concurrent jobs with the same key never share one
+        tmp = Path(tempfile.mkdtemp(dir=root, prefix=f"{key}.tmp."))
+        for src in model_dir.glob("output*.nii.gz"):
+            shutil.copyfile(src, tmp / src.name)
+        _add_ref(tmp, session_id)
+        if entry.exists() and not _outputs(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+        try:
+            tmp.rename(entry)
+        except OSError:
+            # Another job stored the same key first; its outputs are equivalent
+            shutil.rmtree(tmp, ignore_errors=True)
+            _add_ref(entry, session_id)
+    except OSError as e:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+        log_info("SYSTEM", f"Result cache store failed for {key}: {e}")
+
+
+def release_session(session_id: str) -> int:
+    """
+    Drop a deleted or expired session's references and delete the entries
+    nothing else references. Returns count removed.
+    """
+    root = Path(RESULT_CACHE_DIR)
+    if not root.exists():
+        return 0
+
+    removed = 0
+    for entry in root.iterdir():
+        refs = entry / "refs"
+        ref = refs / session_id
+        if not ref.exists():
+            continue
+        ref.unlink(missing_ok=True)
+        if not any(refs.iterdir()):
+            shutil.rmtree(entry, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def prune_cache(max_age_hours: int) -> int:
+    """Delete cache entries not written or hit within max_age_hours. Returns count removed."""
+    root = Path(RESULT_CACHE_DIR)
+    if not root.exists():
+        return 0
+
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for entry in root.iterdir():
+        if entry.is_dir() and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry, ignore_errors=True)
+            removed += 1
+    return removed
@@ -62,11 +62,12 @@ def _create_masked_outputs(fem_dir: Path, m2m_dir: Path, subject: str) -> None:
 
     print(f"Post-processing: creating WM/GM masked magnJ from {magnj_file.name}", flush=True)
 
+    # Read voxels in their working dtypes instead of get_fdata()'s float64 copies
     magnj_img  = nib.load(str(magnj_file))
-    magnj_data = magnj_img.get_fdata()
+    magnj_data = np.asarray(magnj_img.dataobj, dtype=np.float32)
 
     seg_img  = nib.load(str(seg_file))
-    seg_data = np.squeeze(seg_img.get_fdata()).astype(np.int32)
+    seg_data = np.squeeze(np.asarray(seg_img.dataobj, dtype=np.int32))
 
     wm_mask    = seg_data == 1
     gm_mask    = seg_data == 2
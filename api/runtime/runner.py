@@ -2,38 +2,48 @@ import torch
 import traceback
 import sys
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 from pathlib import Path
 import nibabel as nib
 
-from monai.networks.nets import UNETR
 from monai.inferers import sliding_window_inference
 from monai.transforms import ResizeWithPadOrCrop
 
-from runtime.preprocess import preprocess_image
+from runtime.preprocess import preprocess_image, shared_volume, open_gzip_writer
 from runtime.registry import get_model_config
+from runtime.model_cache import get_model, autocast, roi_weight_map
 from runtime.session import session_log, model_output_path, session_input_native
 from runtime.freesurfer import convert_to_native
 from runtime.sse import push_event
 from services.redis_client import set_progress
 from services.logger import log_event, log_error
+from config import SW_OVERLAP, SW_MODE, SW_SIGMA_SCALE, SW_BATCH_SIZE, INFERENCE_AMP
 
 
 class ModelRunner:
     """
     Runs a single model end-to-end:
-      - load UNETR
+      - fetch UNETR from the process-wide model cache
       - preprocess input
       - perform sliding window inference
       - save NIfTI output
       - log & SSE events
     """
 
-    def __init__(self, model_name: str, session_id: str, gpu_id: int, input_space: str = "native"):
+    def __init__(self, model_name: str, session_id: str, gpu_id: int, input_space: str = "native",
+                 overlap: float | None = None, on_device_done=None):
         self.model_name = model_name
         self.session_id = session_id
         self.gpu_id = gpu_id
         self.input_space = input_space  # "native" or "freesurfer"
+        self.overlap = SW_OVERLAP if overlap is None else overlap
+        # Called once the labels are on the host, so the GPU can be handed to
+        # the next model while this one gzips/converts its output
+        self.on_device_done = on_device_done
+        # Set when a FreeSurfer model's output could not be brought back to
+        # native space; the FS-space fallback must not be cached as the result
+        self.native_conversion_failed = False
 
         self.config = get_model_config(model_name)
         self.spatial_size = self.config["spatial_size"]
@@ -75,30 +85,16 @@ class ModelRunner:
             log_error(self.session_id, msg)
             raise FileNotFoundError(msg)
 
-        self.model = UNETR(
-            in_channels=1,
-            out_channels=self.num_classes,
-            img_size=self.spatial_size,
-            feature_size=16,
-            hidden_size=768,
-            mlp_dim=3072,
-            num_heads=12,
-            proj_type=self.proj_type,
-            norm_name="instance",
-            res_block=True,
-            dropout_rate=0.0,
+        self.model, cached = get_model(
+            self.checkpoint, self.spatial_size, self.num_classes, self.proj_type, self.device
         )
-
-        state = torch.load(self.checkpoint, map_location="cpu", weights_only=True)
-        state = {k.replace("module.", ""): v for k, v in state.items()}
-        self.model.load_state_dict(state, strict=False)
-
-        self.model = self.model.to(self.device).eval()
+        if cached:
+            session_log(self.session_id, f"[{self.model_name}] Reusing cached model on GPU {self.gpu_id}")
 
         self._emit("model_load_complete", 10)
 
     # -------------------------------------------------------
-    def preprocess_input(self, input_path: Path):
+    def preprocess_input(self, input_path: Path, volume=None):
         session_log(self.session_id, f"[{self.model_name}] Preprocessing input")
         self._emit("preprocess_start", 15)
 
@@ -118,38 +114,79 @@ class ModelRunner:
             fixed_range=self.fixed_range,
             resize_spatial_size=self.resize_spatial_size,
             skip_spatial_transforms=is_fs_model,
+            device=self.device,
+            volume=volume,
         )
 
-        # Move tensor to GPU - shape is (1, 1, D, H, W)
+        # Already on the GPU (spatial transforms ran there) - shape is (1, 1, D, H, W)
         image_tensor = image_tensor.to(self.device)
 
         self._emit("preprocess_complete", 25)
         return image_tensor, input_img
 
     # -------------------------------------------------------
-    @torch.no_grad()
+    @torch.inference_mode()
     def infer(self, tensor):
         session_log(self.session_id, f"[{self.model_name}] Inference start on GPU {self.gpu_id}")
         self._emit("inference_start", 30)
 
-        # Try with sw_batch_size=4 first, retry with 2 on OOM (matching v1 behavior)
-        batch_sizes = [2, 1]
+        # Start at SW_BATCH_SIZE windows per forward, halving on OOM down to 1.
+        # Last resort on CUDA: keep the (1, C, D, H, W) output and count map in
+        # host memory and flush windows to it in slabs (buffer_steps), so the
+        # GPU only holds the model and the windows in flight.
+        rungs = [(SW_BATCH_SIZE, self.device)]
+        while rungs[-1][0] > 1:
+            rungs.append((rungs[-1][0] // 2, self.device))
+        if self.device.startswith("cuda"):
+            rungs.append((1, "cpu"))
         preds = None
-
-        for sw_batch_size in batch_sizes:
+        if self.device.startswith("cuda"):
+            # One model per leased GPU, so the peak below belongs to this run
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+        # A volume that fits in one window (e.g. 256^3 FreeSurfer input with a
+        # 256^3 roi) is a single forward pass at any overlap, and blending one
+        # window is an identity, so skip the Gaussian weighting entirely
+        overlap, mode = self.overlap, SW_MODE
+        if all(d <= r for d, r in zip(tensor.shape[2:], self.spatial_size)):
+            overlap, mode = 0.0, "constant"
+
+        # MONAI allocates its (1, C, D, H, W) output and count map in the input's
+        # dtype. Under AMP the windows come back in half precision anyway, so a
+        # fp16 input halves the largest buffer of the run (768 -> 384 MB for 12
+        # classes at 256^3); fp16 over bf16 for the mantissa the overlapping
+        # window sums need. Windows are cast back to fp32 at the model's input.
+        predictor = self.model
+        if INFERENCE_AMP and self.device.startswith("cuda"):
+            tensor = tensor.half()
+            predictor = lambda window: self.model(window.float())  # noqa: E731
+
+        for sw_batch_size, out_device in rungs:
+            buffered = out_device != self.device
+            # Host aggregation stays fp32: half-precision adds are slow on the CPU
+            inputs = tensor.float() if buffered else tensor
+            weights = None if mode == "constant" else roi_weight_map(self.spatial_size, self.device, inputs.dtype)
             try:
-                session_log(self.session_id, f"[{self.model_name}] Trying sw_batch_size={sw_batch_size}")
-                preds = sliding_window_inference(
-                    inputs=tensor,
-                    roi_size=self.spatial_size,
-                    sw_batch_size=sw_batch_size,
-                    predictor=self.model,
-                    overlap=0.8,
-                )
+                session_log(self.session_id, f"[{self.model_name}] Trying sw_batch_size={sw_batch_size}, overlap={overlap}, mode={mode}"
+                            + (", aggregating on host" if buffered else ""))
+                with autocast(self.device):
+                    preds = sliding_window_inference(
+                        inputs=inputs,
+                        roi_size=self.spatial_size,
+                        sw_batch_size=sw_batch_size,
+                        predictor=predictor,
+                        overlap=overlap,
+                        mode=mode,
+                        sigma_scale=SW_SIGMA_SCALE,
+                        roi_weight_map=weights,
+                        sw_device=self.device,
+                        device=out_device,
+                        buffer_steps=1 if buffered else None,
+                    )
                 break  # Success, exit retry loop
             except RuntimeError as e:
-                if "out of memory" in str(e).lower() and sw_batch_size > batch_sizes[-1]:
-                    session_log(self.session_id, f"[{self.model_name}] OOM with sw_batch_size={sw_batch_size}, retrying with smaller batch")
+                if "out of memory" in str(e).lower() and (sw_batch_size, out_device) != rungs[-1]:
+                    session_log(self.session_id, f"[{self.model_name}] OOM with sw_batch_size={sw_batch_size}, retrying with less GPU memory")
                     torch.cuda.empty_cache()
                     continue
                 else:
@@ -159,7 +196,11 @@ class ModelRunner:
             raise RuntimeError(f"Inference failed for {self.model_name} even with smallest batch size")
 
         self._emit("inference_mid", 65)
-        session_log(self.session_id, f"[{self.model_name}] Inference finished")
+        if self.device.startswith("cuda"):
+            peak_mib = torch.cuda.max_memory_allocated(self.device) / (1 << 20)
+            session_log(self.session_id, f"[{self.model_name}] Inference finished (peak GPU memory {peak_mib:.0f} MiB)")
+        else:
+            session_log(self.session_id, f"[{self.model_name}] Inference finished")
 
         return preds
 
@@ -173,7 +214,17 @@ class ModelRunner:
         """
         self._emit("save_start", 70)
 
-        preds_np = torch.argmax(preds, dim=1).cpu().numpy().squeeze()
+        # Reduce to labels on the GPU and copy back one uint8 volume instead of
+        # the (1, C, D, H, W) float logits; 12 classes fit in a byte. (Host
+        # aggregated preds from the last OOM rung are already on the CPU.)
+        labels = torch.argmax(preds, dim=1).to(torch.uint8).squeeze(0)
+        del preds
+        # The array outlives the device lease, so copy into a fresh host array
+        preds_np = labels.cpu().numpy()
+        del labels
+
+        if self.on_device_done is not None:
+            self.on_device_done()
 
         is_fs_model = self.config.get("space") == "freesurfer"
 
@@ -189,11 +240,17 @@ class ModelRunner:
             preds_np = resize_back(preds_np[np.newaxis, ...])[0]
 
         out_path = model_output_path(self.session_id, self.model_name)
-        preds_np = preds_np.astype("uint8")
+        preds_np = preds_np.astype(np.uint8, copy=False)
 
         # Save with input's affine and header
         pred_img = nib.Nifti1Image(preds_np, affine=input_img.affine, header=input_img.header)
-        nib.save(pred_img, str(out_path))
+        # The copied header carries the input's on-disk dtype (often int16/float32);
+        # store labels as uint8 so the file is smaller and faster to gzip
+        pred_img.set_data_dtype(np.uint8)
+        # Serialized up front: nibabel seeks while writing, which a threaded
+        # gzip stream can't do (the uint8 volume is at most tens of MB)
+        with open_gzip_writer(out_path) as f:
+            f.write(pred_img.to_bytes())
 
         session_log(self.session_id, f"[{self.model_name}] Saved to {out_path}")
 
@@ -220,6 +277,7 @@ class ModelRunner:
                 session_log(self.session_id, f"[{self.model_name}] Native space output saved as default")
             else:
                 session_log(self.session_id, f"[{self.model_name}] WARNING: Native conversion failed, keeping FS-space output")
+                self.native_conversion_failed = True
         elif is_fs_model:
             session_log(self.session_id, f"[{self.model_name}] Input was FreeSurfer space — skipping native conversion")
 
@@ -230,10 +288,14 @@ class ModelRunner:
     # -------------------------------------------------------
     def run(self, input_path: Path):
         try:
-            self.load_model()
-            tensor, input_img = self.preprocess_input(input_path)
-            preds = self.infer(tensor)
-            return self.save_output(preds, input_img)
+            # Decompress the input on a CPU thread while the checkpoint loads to the
+            # GPU; other models of the job reading the same file share the decode
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                volume = pool.submit(shared_volume, input_path)
+                self.load_model()
+                tensor, input_img = self.preprocess_input(input_path, volume.result())
+            # No local reference to the logits: save_output frees them after argmax
+            return self.save_output(self.infer(tensor), input_img)
 
         except Exception as e:
             exc_type, exc_value, exc_tb = sys.exc_info()
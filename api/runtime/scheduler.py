@@ -4,13 +4,15 @@ import threading
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from services.redis_client import redis_client, set_job_status
+from services.redis_client import redis_client, set_job_status, set_job_statuses, set_progress
 from services.logger import log_info, log_error, log_event
 
 from runtime.runner import ModelRunner
-from runtime.session import session_log
+from runtime.session import session_log, model_output_path, session_path
+from runtime.preprocess import release_volumes
 from runtime.sse import push_event
-from config import GPU_COUNT
+from runtime import result_cache
+from config import GPU_COUNT, RESULT_CACHE_ENABLED
 
 GPU_LOCK_KEY = "gpu_locks"
 JOB_QUEUE_KEY = "job_queue"
@@ -22,6 +24,9 @@ class GPUScheduler:
         self.num_gpus = num_gpus
         self.poll_interval = poll_interval
         self._gpu_lock = threading.Lock()
+        # Signalled on every release so waiting model threads wake immediately
+        # instead of polling (and forking nvidia-smi) on a fixed interval.
+        self._gpu_released = threading.Condition(self._gpu_lock)
         self._init_gpu_locks()
 
     def _init_gpu_locks(self):
@@ -29,19 +34,25 @@ class GPUScheduler:
             redis_client.hset(GPU_LOCK_KEY, gpu_id, "free")
 
     def enqueue(self, job_id: str, payload: dict):
-        redis_client.set(JOB_DATA_PREFIX + job_id, json.dumps(payload))
-        redis_client.rpush(JOB_QUEUE_KEY, json.dumps({"session_id": job_id}))
+        # Statuses first, then payload + queue entry in one round-trip, so the
+        # scheduler loop can't dequeue the job before it is marked queued
+        set_job_statuses(job_id, payload["models"], "queued")
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(JOB_DATA_PREFIX + job_id, json.dumps(payload))
+        pipe.rpush(JOB_QUEUE_KEY, json.dumps({"session_id": job_id}))
+        pipe.execute()
 
         log_info(job_id, f"Job enqueued. Models={payload['models']}")
 
-        for model_name in payload["models"]:
-            set_job_status(job_id, model_name, "queued")
-
         push_event(job_id, {"event": "queued"})
         log_event(job_id, {"event": "queued"})
 
     def _gpu_free_memory_mib(self, gpu_id: int) -> float:
-        """Return actual free memory (MiB) for a GPU via nvidia-smi."""
+        """
+        Return usable free memory (MiB) for a GPU: nvidia-smi's free figure plus
+        blocks PyTorch's caching allocator in this process holds but isn't using,
+        which the next model here reuses without a cudaMalloc.
+        """
         try:
             import subprocess
             result = subprocess.check_output(
@@ -49,60 +60,109 @@ class GPUScheduler:
                  "--query-gpu=memory.free", "--format=csv,noheader,nounits"],
                 timeout=5
             ).decode().strip()
-            return float(result.split("\n")[0])
+            free_mib = float(result.split("\n")[0])
         except Exception:
             return float("inf")  # can't check → don't block
+        try:
+            import torch
+            if torch.cuda.is_initialized():
+                cached = torch.cuda.memory_reserved(gpu_id) - torch.cuda.memory_allocated(gpu_id)
+                free_mib += cached / (1 << 20)
+        except Exception:
+            pass
+        return free_mib
 
-    def acquire_gpu(self, job_id: str, model_name: str, min_free_mib: float = 4096):
+    def acquire_gpu(self, job_id: str, model_name: str, min_free_mib: float = 4096, wait: float = 0.0):
         """
         Atomically find and lock a free GPU that also has enough actual VRAM.
+        If none is available, block up to `wait` seconds for a release and retry once.
         Returns gpu_id if successful, None if no GPU available.
         """
-        with self._gpu_lock:
-            for gpu_id in range(self.num_gpus):
-                status = redis_client.hget(GPU_LOCK_KEY, gpu_id)
-                if status != "free":
-                    continue
-                free_mib = self._gpu_free_memory_mib(gpu_id)
-                if free_mib < min_free_mib:
-                    log_info(job_id, f"GPU {gpu_id} skipped — only {free_mib:.0f} MiB free")
-                    continue
-                redis_client.hset(GPU_LOCK_KEY, gpu_id, f"{job_id}:{model_name}")
-                log_info(job_id, f"GPU {gpu_id} acquired for {model_name} ({free_mib:.0f} MiB free)")
-                return gpu_id
+        with self._gpu_released:
+            gpu_id = self._try_acquire(job_id, model_name, min_free_mib)
+            if gpu_id is None and wait > 0:
+                self._gpu_released.wait(wait)
+                gpu_id = self._try_acquire(job_id, model_name, min_free_mib)
+            return gpu_id
+
+    def _try_acquire(self, job_id: str, model_name: str, min_free_mib: float):
+        """Lock the first free GPU with enough VRAM (caller holds _gpu_lock)."""
+        for gpu_id in range(self.num_gpus):
+            status = redis_client.hget(GPU_LOCK_KEY, gpu_id)
+            if status != "free":
+                continue
+            free_mib = self._gpu_free_memory_mib(gpu_id)
+            if free_mib < min_free_mib:
+                log_info(job_id, f"GPU {gpu_id} skipped — only {free_mib:.0f} MiB free")
+                continue
+            redis_client.hset(GPU_LOCK_KEY, gpu_id, f"{job_id}:{model_name}")
+            log_info(job_id, f"GPU {gpu_id} acquired for {model_name} ({free_mib:.0f} MiB free)")
+            return gpu_id
         return None
 
     def release_gpu(self, gpu_id: int, job_id: str = None):
-        """Release a GPU back to the pool."""
-        with self._gpu_lock:
+        """Release a GPU back to the pool and wake threads waiting for one."""
+        with self._gpu_released:
             redis_client.hset(GPU_LOCK_KEY, gpu_id, "free")
+            self._gpu_released.notify_all()
         if job_id:
             log_info(job_id, f"GPU {gpu_id} released")
 
-    def _run_single_model(self, job_id: str, model_name: str, input_path: str, input_space: str = "native"):
+    def _run_single_model(self, job_id: str, model_name: str, input_path: str, input_space: str = "native",
+                          overlap: float | None = None, input_sha256: str | None = None):
         """
         Run a single model on an available GPU.
-        Waits for a GPU, runs inference, releases GPU.
+        Serves a cached result if this upload was already segmented with the same settings,
+        otherwise waits for a GPU, runs inference, releases GPU.
         Returns (model_name, success, error_msg)
         """
+        cache_key = None
+        if RESULT_CACHE_ENABLED and input_sha256:
+            cache_key = result_cache.cache_key(
+                input_sha256, model_name, input_space, Path(input_path).name, overlap
+            )
+            if result_cache.restore(cache_key, model_output_path(job_id, model_name).parent, job_id):
+                session_log(job_id, f"[{model_name}] Identical input already segmented — reusing cached output")
+                event = {"event": "model_complete", "model": model_name, "progress": 100, "cached": True}
+                push_event(job_id, event)
+                log_event(job_id, event)
+                set_progress(job_id, model_name, 100)
+                set_job_status(job_id, model_name, "complete")
+                return (model_name, True, None)
+
         set_job_status(job_id, model_name, "waiting_gpu")
         push_event(job_id, {"event": "model_waiting", "model": model_name, "progress": 0})
 
-        # Wait for a free GPU (with atomic acquisition)
+        # Wait for a free GPU (with atomic acquisition); the wait is woken by
+        # release_gpu and bounded so cancellation is still noticed promptly.
         gpu_id = None
         while gpu_id is None:
             if redis_client.get(f"cancel:{job_id}"):
                 set_job_status(job_id, model_name, "cancelled")
                 return (model_name, False, "Job cancelled by user")
-            gpu_id = self.acquire_gpu(job_id, model_name)
-            if gpu_id is None:
-                time.sleep(0.2)
+            gpu_id = self.acquire_gpu(job_id, model_name, wait=1.0)
 
         set_job_status(job_id, model_name, "running", gpu=gpu_id)
 
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            # No empty_cache(): the next model on this GPU reuses the allocator's
+            # cached blocks, and _gpu_free_memory_mib counts them as free
+            self.release_gpu(gpu_id, job_id)
+
         try:
-            runner = ModelRunner(model_name, job_id, gpu_id, input_space=input_space)
-            runner.run(Path(input_path))
+            # The lease ends as soon as labels reach the host; saving, native-space
+            # conversion and the result-cache copy are CPU work
+            runner = ModelRunner(model_name, job_id, gpu_id, input_space=input_space, overlap=overlap,
+                                 on_device_done=release)
+            out_path = runner.run(Path(input_path))
+            if cache_key and not runner.native_conversion_failed:
+                result_cache.store(cache_key, out_path.parent, job_id)
             set_job_status(job_id, model_name, "complete")
             return (model_name, True, None)
         except Exception as e:
@@ -114,14 +174,7 @@ class GPUScheduler:
             set_job_status(job_id, model_name, "error")
             return (model_name, False, str(e))
         finally:
-            # Flush PyTorch CUDA cache before marking GPU free so the next
-            # acquire_gpu sees accurate free VRAM from nvidia-smi.
-            try:
-                import torch
-                torch.cuda.empty_cache()
-            except Exception:
-                pass
-            self.release_gpu(gpu_id, job_id)
+            release()
 
     def run_job(self, job_id: str):
         """
@@ -147,6 +200,8 @@ class GPUScheduler:
         errors = []
 
         input_space = payload.get("space", "native")
+        overlap = payload.get("overlap")
+        input_sha256 = payload.get("input_sha256")
 
         with ThreadPoolExecutor(max_workers=min(len(steps), self.num_gpus)) as executor:
             futures = {
@@ -156,6 +211,8 @@ class GPUScheduler:
                     step["model"],
                     step["input_path"],
                     input_space,
+                    overlap,
+                    input_sha256,
                 ): step["model"]
                 for step in steps
             }
@@ -170,6 +227,9 @@ class GPUScheduler:
                     errors.append((model_name, str(e)))
                     log_error(job_id, f"Future exception for {model_name}: {e}")
 
+        # The job's decoded input volumes are not needed past its last model
+        release_volumes(session_path(job_id))
+
         if errors:
             error_summary = "; ".join([f"{m}: {e}" for m, e in errors])
             push_event(job_id, {"event": "job_failed", "error": error_summary})
@@ -46,6 +46,10 @@ def roast_working_dir(session_id: str, model_name: str = "", run_id: str = "") -
     return d
 
 
+# (work_dir, output_type) -> (work_dir mtime_ns, resolved output path)
+_roast_output_index: dict[tuple[str, str], tuple[int, Path]] = {}
+
+
 def roast_output_path(session_id: str, output_type: str, model_name: str = "", simulation_tag: str = "tDCSLAB", run_id: str = "") -> Path:
     work_dir = roast_working_dir(session_id, model_name, run_id)
     # Glob-based lookup: ROAST embeds its own hash in the simulation tag, so we
@@ -60,8 +64,25 @@ def roast_output_path(session_id: str, output_type: str, model_name: str = "", s
     }
     if output_type not in glob_patterns:
         raise ValueError(f"Unknown ROAST output type: {output_type}")
+
+    # ROAST work dirs hold meshes and intermediates, so the glob is O(files) per
+    # download. Reuse the last answer while the directory listing is unchanged
+    # (the dir mtime moves whenever ROAST creates or removes a file). Misses are
+    # not cached: an output created in the same mtime tick as a failed lookup
+    # would otherwise stay hidden.
+    key = (str(work_dir), output_type)
+    dir_mtime = work_dir.stat().st_mtime_ns
+    cached = _roast_output_index.get(key)
+    if cached is not None and cached[0] == dir_mtime:
+        return cached[1]
+
     matches = sorted(work_dir.glob(glob_patterns[output_type]), key=lambda p: p.stat().st_mtime, reverse=True)
-    return matches[0] if matches else work_dir / f"_missing_{output_type}.nii"
+    if not matches:
+        return work_dir / f"_missing_{output_type}.nii"
+    if len(_roast_output_index) >= 4096:
+        _roast_output_index.clear()
+    _roast_output_index[key] = (dir_mtime, matches[0])
+    return matches[0]
 
 
 # -----------------------------------------------------------
@@ -156,6 +177,8 @@ def cleanup_old_sessions(default_max_age_hours: int = 24) -> int:
     """
     from services.redis_client import redis_client
     from services.workspace_db import get_user_retention_days
+    from runtime.result_cache import release_session
+    from runtime.preprocess import release_volumes
 
     deleted = 0
     sessions_root = Path(SESSION_DIR)
@@ -181,6 +204,8 @@ def cleanup_old_sessions(default_max_age_hours: int = 24) -> int:
         if session_dir.stat().st_mtime < cutoff:
             try:
                 shutil.rmtree(session_dir)
+                release_session(session_dir.name)
+                release_volumes(session_dir)
                 log_info("SYSTEM", f"Cleaned up old session: {session_dir.name}")
                 deleted += 1
             except Exception as e:
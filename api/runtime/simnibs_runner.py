@@ -741,8 +741,11 @@ class SimNIBSRunner:
         while not solve_done.wait(timeout=10):
             if time.time() > deadline:
                 raise TimeoutError("SimNIBS FEM solve timed out")
-            progress = min(92, progress + 2)
-            self._emit("simnibs_fem_solve", progress)
+            # Once capped at 92 the heartbeat carries no news: skip the SSE push,
+            # log line and two Redis writes (the SSE stream has its own keepalive)
+            if progress < 92:
+                progress = min(92, progress + 2)
+                self._emit("simnibs_fem_solve", progress)
 
         if solve_error:
             raise solve_error[0]
@@ -2,31 +2,33 @@ import json
 import time
 import hmac
 import hashlib
-from typing import Dict, Generator
+from typing import AsyncGenerator, Dict
 
 # from fastapi import HTTPException
 # from fastapi.responses import StreamingResponse
 
-from config import HMAC_SECRET
-from services.redis_client import redis_client
+from config import HMAC_SECRET, SSE_HEARTBEAT_SECONDS
+from services.redis_client import redis_client, async_redis_client
 from runtime.session import session_log
 
 
 # -------------------------------------------------------------------
 # HMAC signing
 # -------------------------------------------------------------------
+# Keyed once at import; each signature copies the keyed state instead of
+# re-deriving the HMAC pads from the secret.
+_HMAC_BASE = hmac.new(HMAC_SECRET.encode("utf-8"), digestmod=hashlib.sha256)
+
+
 def sign_event(event: Dict) -> str:
     """
     Produce an HMAC SHA256 signature for each SSE event.
     Ensures frontend can trust event origin.
     """
     raw = json.dumps(event, sort_keys=True).encode("utf-8")
-    signature = hmac.new(
-        HMAC_SECRET.encode("utf-8"),
-        raw,
-        hashlib.sha256
-    ).hexdigest()
-    return signature
+    mac = _HMAC_BASE.copy()
+    mac.update(raw)
+    return mac.hexdigest()
 
 
 # -------------------------------------------------------------------
@@ -44,19 +46,28 @@ def push_event(session_id: str, event: Dict):
     signature = sign_event(event)
     envelope = {"event": event, "sig": signature}
 
-    redis_client.rpush(redis_event_key(session_id), json.dumps(envelope))
-    redis_client.expire(redis_event_key(session_id), 3600)  # 1 hour retention
+    # One round trip for the append + TTL refresh
+    key = redis_event_key(session_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.rpush(key, json.dumps(envelope))
+    pipe.expire(key, 3600)  # 1 hour retention
+    pipe.execute()
 
 
 # -------------------------------------------------------------------
 # Streaming generator
 # -------------------------------------------------------------------
-def sse_stream(session_id: str, terminate_on: tuple = ("job_complete", "job_failed")) -> Generator[str, None, None]:
+# Events already queued when the stream wakes are sent in one chunk (up to this many)
+SSE_MAX_BATCH = 32
+
+
+async def sse_stream(session_id: str, terminate_on: tuple = ("job_complete", "job_failed")) -> AsyncGenerator[str, None]:
     """
     Reads events from Redis and emits SSE messages.
+    Runs on the event loop (async Redis), so idle streams cost no threads.
     Includes:
     - real events
-    - heartbeat every 5s
+    - heartbeat after SSE_HEARTBEAT_SECONDS without events
     - graceful stopping on "job_complete" or "job_failed"
     """
 
@@ -66,36 +77,55 @@ def sse_stream(session_id: str, terminate_on: tuple = ("job_complete", "job_fail
     last_event_time = time.time()
 
     while True:
-        # Block for up to 1 second for new events
-        packet = redis_client.blpop(queue_key, timeout=1)
+        # BLPOP returns as soon as push_event appends, so only the heartbeat
+        # needs a timeout: sleep until it is due rather than waking every second
+        wait = max(0.1, SSE_HEARTBEAT_SECONDS - (time.time() - last_event_time))
+        packet = await async_redis_client.blpop(queue_key, timeout=wait)
 
         # Emit heartbeat if quiet
         if packet is None:
-            if time.time() - last_event_time > 5:
+            if time.time() - last_event_time >= SSE_HEARTBEAT_SECONDS:
                 heartbeat = {"event": "heartbeat", "ts": time.time()}
                 signed = sign_event(heartbeat)
                 yield f"data: {json.dumps({'event': heartbeat, 'sig': signed})}\n\n"
                 last_event_time = time.time()
             continue
 
-        # Parse event
+        # Drain whatever else is already queued so a burst of progress events
+        # goes out as one write instead of one per event
         _, raw = packet
-
-        # raw is str when decode_responses=True; bytes otherwise
-        if isinstance(raw, bytes):
-            raw = raw.decode("utf-8")
-        
-        envelope = json.loads(raw)
-
-        event = envelope["event"]
-        sig = envelope["sig"]
-
-        # Send event to client
-        yield f"data: {json.dumps({'event': event, 'sig': sig})}\n\n"
+        backlog = await async_redis_client.lpop(queue_key, SSE_MAX_BATCH - 1) or []
+        raws = [raw, *backlog]
+
+        chunks = []
+        finished = False
+        for i, raw in enumerate(raws):
+            # raw is str when decode_responses=True; bytes otherwise
+            if isinstance(raw, bytes):
+                raw = raw.decode("utf-8")
+
+            # The stored envelope is already the {"event", "sig"} JSON frame body,
+            # so forward it as-is; it is parsed only to spot the final event
+            event = json.loads(raw)["event"]
+
+            chunks.append(f"data: {raw}\n\n")
+
+            # Termination signals: hand anything after the final event back to the queue
+            if event.get("event") in terminate_on:
+                leftover = raws[i + 1:]
+                if leftover:
+                    pipe = async_redis_client.pipeline(transaction=False)
+                    pipe.lpush(queue_key, *reversed(leftover))
+                    pipe.expire(queue_key, 3600)
+                    await pipe.execute()
+                finished = True
+                break
+
+        # Send events to client
+        yield "".join(chunks)
         last_event_time = time.time()
 
-        # Termination signals
-        if event.get("event") in terminate_on:
+        if finished:
             session_log(session_id, "SSE stream closing due to final event.")
             break
 
@@ -1,8 +1,15 @@
 import datetime
+import threading
+import time
+from collections import OrderedDict
+
 import jwt
 from fastapi import HTTPException, Header
 from config import JWT_SECRET, JWT_ALGORITHM
 
+# HS256 key as bytes once, rather than PyJWT encoding the str secret per call
+_JWT_KEY = JWT_SECRET.encode("utf-8")
+
 
 def create_jwt(payload: dict, expires_minutes: int = 480) -> str:
     """Mint a signed JWT with an exp claim (default 8 hours)."""
@@ -10,24 +17,48 @@ def create_jwt(payload: dict, expires_minutes: int = 480) -> str:
         **payload,
         "exp": datetime.datetime.utcnow() + datetime.timedelta(minutes=expires_minutes),
     }
-    return jwt.encode(data, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return jwt.encode(data, _JWT_KEY, algorithm=JWT_ALGORITHM)
 
 
 def validate_jwt(token: str) -> bool:
     try:
-        jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        jwt.decode(token, _JWT_KEY, algorithms=[JWT_ALGORITHM])
         return True
     except Exception:
         return False
 
 
+# Verified tokens -> (payload, expiry epoch). The frontend sends the same bearer
+# token on every poll/download, so repeat requests skip the signature check.
+_TOKEN_CACHE_MAX = 1024
+_TOKEN_CACHE_MAX_AGE = 300  # seconds, for tokens without an exp claim
+_token_cache: "OrderedDict[str, tuple[dict, float]]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+
 def decode_jwt(token: str) -> dict | None:
     """Decode and validate a JWT. Returns full payload or None on failure."""
+    now = time.time()
+    with _token_cache_lock:
+        entry = _token_cache.get(token)
+        if entry is not None:
+            if entry[1] > now:
+                _token_cache.move_to_end(token)
+                return dict(entry[0])
+            del _token_cache[token]
+
     try:
-        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = jwt.decode(token, _JWT_KEY, algorithms=[JWT_ALGORITHM])
     except Exception:
         return None
 
+    expires = payload.get("exp", now + _TOKEN_CACHE_MAX_AGE)
+    with _token_cache_lock:
+        _token_cache[token] = (payload, float(expires))
+        while len(_token_cache) > _TOKEN_CACHE_MAX:
+            _token_cache.popitem(last=False)
+    return dict(payload)
+
 
 def _extract_bearer(authorization: str) -> str | None:
     if not authorization.startswith("Bearer "):
@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio as aioredis
 import json
 from config import REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD
 
@@ -13,6 +14,16 @@ redis_client = redis.Redis(
     decode_responses=True
 )
 
+# Async client for code running on the event loop (SSE streams), so a client
+# waiting on BLPOP does not hold a threadpool thread
+async_redis_client = aioredis.Redis(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    password=REDIS_PASSWORD,
+    decode_responses=True
+)
+
 JOB_QUEUE = "job_queue"
 GPU_POOL = "gpu_pool"              # set of free GPUs
 SESSION_STATUS = "session_status"  # hash: session -> status
@@ -39,6 +50,30 @@ def _active_field(job_type: str, session_id: str, model: str, run_id: str = "")
     return f"{job_type}:{session_id}:{model}:{run_id}" if run_id else f"{job_type}:{session_id}:{model}"
 
 
+def _job_record(raw: str | None, job_type: str, session_id: str, model: str, run_id: str = "",
+                status: str | None = None, progress: float | None = None,
+                gpu: str | None = None) -> dict:
+    """A new active_jobs entry, or the stored one (raw JSON) with the given fields updated."""
+    if raw is None:
+        return {
+            "type": job_type,
+            "session_id": session_id,
+            "model": model,
+            "run_id": run_id or None,
+            "status": status,
+            "progress": float(progress) if progress is not None else 0.0,
+            "gpu": str(gpu) if gpu is not None else None,
+        }
+    data = json.loads(raw)
+    if status is not None:
+        data["status"] = status
+    if progress is not None:
+        data["progress"] = float(progress)
+    if gpu is not None:
+        data["gpu"] = str(gpu)
+    return data
+
+
 def _upsert_job(job_type: str, session_id: str, model: str, run_id: str = "",
                 status: str | None = None, progress: float | None = None,
                 gpu: str | None = None) -> None:
@@ -53,29 +88,11 @@ def _upsert_job(job_type: str, session_id: str, model: str, run_id: str = "",
         redis_client.hdel(ACTIVE_JOBS_KEY, field)
         return
     raw = redis_client.hget(ACTIVE_JOBS_KEY, field)
-    if raw is None:
-        if status is None:
-            # Progress-only update for a job not in the registry — already
-            # completed/removed, nothing to do.
-            return
-        # First time we see this job — create the entry.
-        data: dict = {
-            "type": job_type,
-            "session_id": session_id,
-            "model": model,
-            "run_id": run_id or None,
-            "status": status,
-            "progress": float(progress) if progress is not None else 0.0,
-            "gpu": str(gpu) if gpu is not None else None,
-        }
-    else:
-        data = json.loads(raw)
-        if status is not None:
-            data["status"] = status
-        if progress is not None:
-            data["progress"] = float(progress)
-        if gpu is not None:
-            data["gpu"] = str(gpu)
+    if raw is None and status is None:
+        # Progress-only update for a job not in the registry — already
+        # completed/removed, nothing to do.
+        return
+    data = _job_record(raw, job_type, session_id, model, run_id, status, progress, gpu)
     redis_client.hset(ACTIVE_JOBS_KEY, field, json.dumps(data))
 
 
@@ -128,6 +145,24 @@ def set_job_status(session_id: str, model: str, status: str, gpu: str | int | No
                 gpu=str(gpu) if gpu is not None else None)
 
 
+def set_job_statuses(session_id: str, models: list[str], status: str):
+    """set_job_status for several models of one session in two round-trips."""
+    if not models:
+        return
+    fields = [_active_field("gpu_seg", session_id, m) for m in models]
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hset(f"{JOB_STATUS}:{session_id}", mapping={m: status for m in models})
+    if status in _TERMINAL:
+        pipe.hdel(ACTIVE_JOBS_KEY, *fields)
+    else:
+        entries = {
+            field: json.dumps(_job_record(raw, "gpu_seg", session_id, model, status=status))
+            for model, field, raw in zip(models, fields, redis_client.hmget(ACTIVE_JOBS_KEY, fields))
+        }
+        pipe.hset(ACTIVE_JOBS_KEY, mapping=entries)
+    pipe.execute()
+
+
 def get_job_status(session_id: str, model: str):
     return redis_client.hget(f"{JOB_STATUS}:{session_id}", model)
 
@@ -46,7 +46,9 @@ export default function GPUStatus() {
         {/* Queue */}
         <div className="flex items-center justify-between">
           <span className="text-foreground-secondary">Queue</span>
-          <span className="text-foreground font-medium">{health.queue_length} jobs</span>
+          <span className="text-foreground font-medium">
+            {health.queue_length !== null && health.queue_length >= 0 ? `${health.queue_length} jobs` : "—"}
+          </span>
         </div>
 
         {/* CPU */}
@@ -27,7 +27,7 @@ export interface HealthResponse {
         mem_total: number;
       }>
     | string;
-  queue_length: number;
+  queue_length: number | null;
   gpu_count: number;
   cpu_count: number;
   mem_total_mb: number;